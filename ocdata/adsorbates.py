@@ -1,6 +1,7 @@
 
 import numpy as np
-import pickle
+
+from .loaders import load_pickle
 
 
 class Adsorbate():
@@ -38,13 +39,12 @@ class Adsorbate():
                                      the adsorbate that are meant to be bonded to the surface
             adsorbate_sampling_str   Enum string specifying the sample, [index]/[total]
         '''
-        with open(adsorbate_database, 'rb') as f:
-            inv_index = pickle.load(f)
+        inv_index = load_pickle(adsorbate_database)
 
         if specified_index is not None:
             element = specified_index
         else:
-            element = np.random.choice(len(inv_index))
+            element = np.random.randint(len(inv_index))
 
         self.adsorbate_sampling_str = str(element) + "/" + str(len(inv_index))
         self.atoms, self.smiles, self.bond_indices = inv_index[element]
@@ -0,0 +1,41 @@
+'''
+Helper script to compress existing pkl files with zstd. Every `X.pkl` is
+re-written next to the original as `X.pkl.zst`, which `ocdata.loaders.load_pickle`
+reads transparently. Directories (e.g. of precomputed surfaces) are walked
+for pkl files.
+'''
+
+import argparse
+import os
+
+from ocdata.loaders import ZSTD_SUFFIX, dump_pickle, load_pickle
+
+
+def compress_pkl(path, level=3):
+    '''
+    Compresses one pkl file and returns the path of the compressed copy
+    '''
+    output_path = path + ZSTD_SUFFIX
+    dump_pickle(load_pickle(path), output_path, level)
+    load_pickle.cache_clear()
+    print(path, os.path.getsize(path), '->', output_path, os.path.getsize(output_path))
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compress pkl files with zstd')
+    parser.add_argument('paths', nargs='+', help='pkl files or directories of pkl files')
+    parser.add_argument('--level', type=int, default=3, help='zstd compression level')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith('.pkl'):
+                    compress_pkl(os.path.join(path, filename), args.level)
+        else:
+            compress_pkl(path, args.level)
+
+
+if __name__ == "__main__":
+    main()
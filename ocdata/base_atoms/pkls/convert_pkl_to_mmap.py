@@ -0,0 +1,22 @@
+'''
+Helper script to convert a bulk pkl (inverted index) into a memory-mappable
+blob. Writes `output` plus `output.offsets.npy` and `output.keys.npy`; pass `output` as the bulk
+database to `sample_structure.py` and it will be memory-mapped.
+'''
+
+import argparse
+
+from ocdata.loaders import dump_mmap_index, load_pickle
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a bulk pkl into a memory-mappable blob')
+    parser.add_argument('input_pkl', help='bulk pkl file, e.g. bulks_may12.pkl')
+    parser.add_argument('output', help='output blob, e.g. bulks_may12.bin')
+    args = parser.parse_args()
+
+    dump_mmap_index(load_pickle(args.input_pkl), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,38 @@
 
+import functools
+import hashlib
 import math
 import numpy as np
 import os
-import pickle
 
+from collections.abc import Sequence
+from joblib import Parallel, delayed
+from pymatgen import Lattice, Structure
 from pymatgen.core.surface import SlabGenerator, get_symmetrically_distinct_miller_indices
 from pymatgen.io.ase import AseAtomsAdaptor
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from .constants import MAX_MILLER, COVALENT_MATERIALS_MPIDS
+from .loaders import ZSTD_SUFFIX, dump_pickle, load_pickle
+from .symmetry import get_spacegroup_analyzer
+
+
+@functools.lru_cache(maxsize=None)
+def _cumulative_weights(weights):
+    '''
+    Normalized cumulative distribution of a tuple of sampling weights,
+    computed the same way `np.random.choice` does internally.
+    '''
+    cdf = np.cumsum(weights, dtype=np.double)
+    cdf /= cdf[-1]
+    return cdf
+
+
+def _wrap_frac_coords(frac_coords, eps=1e-7):
+    '''
+    Wraps fractional coordinates into the unit cell the same way `ase.Atoms.wrap`
+    does, i.e. into [-eps, 1 - eps).
+    '''
+    return (frac_coords + eps) % 1.0 - eps
 
 
 class Bulk():
@@ -19,6 +44,10 @@ class Bulk():
     ----------
     precomputed_structures : str
         root dir of precomputed structures
+    surface_cache_dir : str
+        dir where enumerated surfaces are cached, keyed by the standardized bulk
+    n_jobs : int
+        number of processes to enumerate surfaces with
     bulk_atoms : Atoms
         actual atoms of the bulk
     mpid : str
@@ -38,7 +67,8 @@ class Bulk():
         returns a list of possible surfaces for this bulk instance
     '''
 
-    def __init__(self, bulk_database, precomputed_structures=None, bulk_index=None, max_elems=3):
+    def __init__(self, bulk_database, precomputed_structures=None, bulk_index=None, max_elems=3,
+                 surface_cache_dir=None, n_jobs=1):
         '''
         Initializes the object by choosing or sampling from the bulk database
 
@@ -48,8 +78,14 @@ class Bulk():
                                     surface enumeration
             bulk_index: index of bulk to select if not doing a random sample
             max_elems: max number of elements for any bulk
+            surface_cache_dir: Directory in which to cache enumerated surfaces so that
+                               they are only enumerated once per (standardized) bulk.
+                               Ignored if `precomputed_structures` is given.
+            n_jobs: number of processes to enumerate surfaces with (see `enumerate_surfaces`)
         '''
         self.precomputed_structures = precomputed_structures
+        self.surface_cache_dir = surface_cache_dir
+        self.n_jobs = n_jobs
         self.choose_bulk_pkl(bulk_database, bulk_index, max_elems)
 
     def choose_bulk_pkl(self, bulk_db, bulk_index, max_elems):
@@ -58,7 +94,7 @@ class Bulk():
         the specified number of elements in any composition.
 
         Args:
-            bulk_db         Unpickled dict or list of bulks
+            bulk_db         Unpickled (or memory-mapped) dict or list of bulks
             bulk_index      Index of which bulk to select. If None, randomly sample one.
             max_elems       Max elems for any bulk structure. Currently it is 3 by default.
 
@@ -83,10 +119,10 @@ class Bulk():
                 self.sample_n_elems()
                 assert isinstance(bulk_db, dict), 'Did you pass in the correct bulk database?'
                 assert self.n_elems in bulk_db.keys(), f'Bulk db does not have bulks of {self.n_elems} elements'
-                assert isinstance(bulk_db[self.n_elems], list), 'Did you pass in the correct bulk database?'
+                assert isinstance(bulk_db[self.n_elems], Sequence), 'Did you pass in the correct bulk database?'
 
                 total_elements_for_key = len(bulk_db[self.n_elems])
-                row_bulk_index = np.random.choice(total_elements_for_key)
+                row_bulk_index = np.random.randint(total_elements_for_key)
                 self.bulk_atoms, self.mpid, self.bulk_sampling_str, self.index_of_bulk_atoms = bulk_db[self.n_elems][row_bulk_index]
 
         except IndexError:
@@ -110,11 +146,14 @@ class Bulk():
             elem_sampling_str   Enum string of [chosen n_elems]/[total number of choices]
         '''
 
-        possible_n_elems = list(n_cat_elems_weights.keys())
-        weights = list(n_cat_elems_weights.values())
+        possible_n_elems = tuple(n_cat_elems_weights.keys())
+        weights = tuple(n_cat_elems_weights.values())
         assert math.isclose(sum(weights), 1)
 
-        self.n_elems = np.random.choice(possible_n_elems, p=weights)
+        # Same draw as `np.random.choice(possible_n_elems, p=weights)`, but without
+        # validating and normalizing the weights again on every call
+        cdf = _cumulative_weights(weights)
+        self.n_elems = possible_n_elems[np.searchsorted(cdf, np.random.random_sample(), side='right')]
         self.elem_sampling_str = str(self.n_elems) + "/" + str(len(possible_n_elems))
 
     def get_possible_surfaces(self):
@@ -125,24 +164,67 @@ class Bulk():
         '''
         if self.precomputed_structures:
             surfaces_info = self.read_from_precomputed_enumerations(self.index_of_bulk_atoms)
+        elif self.surface_cache_dir:
+            surfaces_info = self.read_or_cache_enumerations()
         else:
-            surfaces_info = self.enumerate_surfaces()
+            surfaces_info = self.enumerate_surfaces(n_jobs=self.n_jobs)
         return surfaces_info
 
     def read_from_precomputed_enumerations(self, index):
         '''
-        Loads relevant pickle of precomputed surfaces.
+        Loads relevant pickle of precomputed surfaces, preferring the zstd
+        compressed `[index].pkl.zst` over `[index].pkl` if both exist.
 
         Args:
             index: bulk index
         Returns:
             surfaces_info: a list of surface_info tuples (atoms, miller, shift, top)
         '''
-        with open(os.path.join(self.precomputed_structures, str(index) + ".pkl"), "rb") as f:
-            surfaces_info = pickle.load(f)
+        path = os.path.join(self.precomputed_structures, str(index) + ".pkl")
+        if os.path.exists(path + ZSTD_SUFFIX):
+            path += ZSTD_SUFFIX
+        surfaces_info = load_pickle(path)
         return surfaces_info
 
-    def enumerate_surfaces(self, max_miller=MAX_MILLER):
+    def read_or_cache_enumerations(self):
+        '''
+        Loads the enumerated surfaces of this bulk from `surface_cache_dir`,
+        enumerating and writing them there first if they are not cached yet.
+
+        Returns:
+            surfaces_info: a list of surface_info tuples (atoms, miller, shift, top)
+        '''
+        path = os.path.join(self.surface_cache_dir, self.get_surface_cache_key() + '.pkl' + ZSTD_SUFFIX)
+        if os.path.exists(path):
+            return load_pickle(path)
+
+        surfaces_info = self.enumerate_surfaces(n_jobs=self.n_jobs)
+        os.makedirs(self.surface_cache_dir, exist_ok=True)
+        dump_pickle(surfaces_info, path)
+        return surfaces_info
+
+    def get_surface_cache_key(self):
+        '''
+        Fingerprints the standardized bulk so that the same bulk maps to the same
+        cached surfaces, regardless of which database index or unit cell it came with.
+
+        Returns:
+            key: a string of the space group number and a hash of the standardized
+                 bulk and of everything else that affects the surface enumeration
+        '''
+        struct = AseAtomsAdaptor.get_structure(self.bulk_atoms)
+        sga = get_spacegroup_analyzer(struct, symprec=0.1)
+        standardized_struct = sga.get_conventional_standard_structure()
+
+        fingerprint = hashlib.sha1()
+        fingerprint.update(standardized_struct.lattice.matrix.round(6).tobytes())
+        fingerprint.update(' '.join(site.species_string for site in standardized_struct).encode())
+        fingerprint.update(standardized_struct.frac_coords.round(6).tobytes())
+        # 2D materials get their slabs filtered, and the enumeration depends on MAX_MILLER
+        fingerprint.update(str((self.mpid in COVALENT_MATERIALS_MPIDS, MAX_MILLER)).encode())
+        return str(sga.get_space_group_number()) + '_' + fingerprint.hexdigest()
+
+    def enumerate_surfaces(self, max_miller=MAX_MILLER, n_jobs=1):
         '''
         Enumerate all the symmetrically distinct surfaces of a bulk structure. It
         will not enumerate surfaces with Miller indices above the `max_miller`
@@ -157,43 +239,59 @@ class Bulk():
                         you are willing to enumerate. Increasing this argument will
                         increase the number of surfaces, but the surfaces will
                         generally become larger.
+            n_jobs      Number of processes to spread the Miller indices over (see
+                        `joblib.Parallel`). -1 uses all CPUs; 1 runs serially.
         Returns:
             all_slabs_info  A list of 4-tuples containing:  `pymatgen.Structure`
                             objects for surfaces we have enumerated, the Miller
                             indices, floats for the shifts, and Booleans for "top".
         '''
         bulk_struct = self.standardize_bulk(self.bulk_atoms)
+        all_millers = get_symmetrically_distinct_miller_indices(bulk_struct, MAX_MILLER)
 
-        all_slabs_info = []
-        for millers in get_symmetrically_distinct_miller_indices(bulk_struct, MAX_MILLER):
-            slab_gen = SlabGenerator(initial_structure=bulk_struct,
-                                     miller_index=millers,
-                                     min_slab_size=7.,
-                                     min_vacuum_size=20.,
-                                     lll_reduce=False,
-                                     center_slab=True,
-                                     primitive=True,
-                                     max_normal_search=1)
-            slabs = slab_gen.get_slabs(tol=0.3,
-                                       bonds=None,
-                                       max_broken_bonds=0,
-                                       symmetrize=False)
-
-            # Additional filtering for the 2D materials' slabs
-            if self.mpid in COVALENT_MATERIALS_MPIDS:
-                slabs = [slab for slab in slabs if is_2D_slab_reasonsable(slab) is True]
-
-            # If the bottoms of the slabs are different than the tops, then we want
-            # to consider them, too
-            if len(slabs) != 0:
-                flipped_slabs_info = [(self.flip_struct(slab), millers, slab.shift, False)
-                                      for slab in slabs if self.is_structure_invertible(slab) is False]
-
-                # Concatenate all the results together
-                slabs_info = [(slab, millers, slab.shift, True) for slab in slabs]
-                all_slabs_info.extend(slabs_info + flipped_slabs_info)
+        # Each Miller index is independent, so we can generate their slabs in parallel
+        slabs_info_per_miller = Parallel(n_jobs=n_jobs, backend='loky')(
+            delayed(self._gen_slabs_for_millers)(bulk_struct, millers) for millers in all_millers)
+        all_slabs_info = sum(slabs_info_per_miller, [])
         return all_slabs_info
 
+    def _gen_slabs_for_millers(self, bulk_struct, millers):
+        '''
+        Generates all the slabs of a bulk structure for one Miller index,
+        including the flipped ones if their bottoms differ from their tops.
+
+        Args:
+            bulk_struct `pymatgen.Structure` of the standardized bulk
+            millers     A 3-tuple of the Miller indices
+        Returns:
+            slabs_info  A list of 4-tuples as in `enumerate_surfaces`
+        '''
+        slab_gen = SlabGenerator(initial_structure=bulk_struct,
+                                 miller_index=millers,
+                                 min_slab_size=7.,
+                                 min_vacuum_size=20.,
+                                 lll_reduce=False,
+                                 center_slab=True,
+                                 primitive=True,
+                                 max_normal_search=1)
+        slabs = slab_gen.get_slabs(tol=0.3,
+                                   bonds=None,
+                                   max_broken_bonds=0,
+                                   symmetrize=False)
+
+        # Additional filtering for the 2D materials' slabs
+        if self.mpid in COVALENT_MATERIALS_MPIDS:
+            slabs = [slab for slab in slabs if self.is_2D_slab_reasonsable(slab) is True]
+
+        # If the bottoms of the slabs are different than the tops, then we want
+        # to consider them, too
+        flipped_slabs_info = [(self.flip_struct(slab), millers, slab.shift, False)
+                              for slab in slabs if self.is_structure_invertible(slab) is False]
+
+        # Concatenate all the results together
+        slabs_info = [(slab, millers, slab.shift, True) for slab in slabs]
+        return slabs_info + flipped_slabs_info
+
     def is_2D_slab_reasonsable(self, struct):
         '''
         There are 400+ 2D bulk materials whose slabs generated by pymaten require
@@ -226,7 +324,7 @@ class Bulk():
             standardized_struct: `pymatgen.Structure` of the standardized bulk
         '''
         struct = AseAtomsAdaptor.get_structure(atoms)
-        sga = SpacegroupAnalyzer(struct, symprec=0.1)
+        sga = get_spacegroup_analyzer(struct, symprec=0.1)
         standardized_struct = sga.get_conventional_standard_structure()
         return standardized_struct
 
@@ -240,19 +338,26 @@ class Bulk():
             flipped_struct: The same `ase.Atoms` object that was fed as an
                             argument, but flipped upside down.
         '''
-        atoms = AseAtomsAdaptor.get_atoms(struct)
-
-        # This is black magic wizardry to me. Good look figuring it out.
-        atoms.wrap()
-        atoms.rotate(180, 'x', rotate_cell=True, center='COM')
-        if atoms.cell[2][2] < 0.:
-            atoms.cell[2] = -atoms.cell[2]
-        if np.cross(atoms.cell[0], atoms.cell[1])[2] < 0.0:
-            atoms.cell[1] = -atoms.cell[1]
-        atoms.center()
-        atoms.wrap()
-
-        flipped_struct = AseAtomsAdaptor.get_structure(atoms)
+        # We rotate the atoms and the cell by 180 degrees about x, flip cell vectors
+        # back so the cell is right-handed and points up, then center and wrap the
+        # atoms. In fractional coordinates the rotation is a no-op (atoms and cell
+        # move together, and the rotation center does not matter since we center
+        # afterwards), while flipping a cell vector negates that coordinate.
+        frac_coords = _wrap_frac_coords(struct.frac_coords)
+        cell = struct.lattice.matrix * [1., -1., -1.]
+        if cell[2, 2] < 0.:
+            cell[2] = -cell[2]
+            frac_coords[:, 2] = -frac_coords[:, 2]
+        if np.cross(cell[0], cell[1])[2] < 0.0:
+            cell[1] = -cell[1]
+            frac_coords[:, 1] = -frac_coords[:, 1]
+
+        # Same as `ase.Atoms.center`, which centers the atoms in fractional space
+        frac_coords += 0.5 - (frac_coords.min(axis=0) + frac_coords.max(axis=0)) / 2.
+        frac_coords = _wrap_frac_coords(frac_coords)
+
+        symbols = [site.specie.symbol for site in struct]
+        flipped_struct = Structure(Lattice(cell), symbols, frac_coords)
         return flipped_struct
 
     def is_structure_invertible(self, structure):
@@ -277,9 +382,7 @@ class Bulk():
         # If any of the operations involve a transformation in the z-direction,
         # then the structure is invertible.
         sga = SpacegroupAnalyzer(structure, symprec=0.1)
-        for operation in sga.get_symmetry_operations():
-            xform_matrix = operation.affine_matrix
-            z_xform = xform_matrix[2, 2]
-            if z_xform == -1:
+        for operation in sga.get_symmetry_operations(cartesian=False):
+            if operation.rotation_matrix[2, 2] == -1:
                 return True
         return False
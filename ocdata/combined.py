@@ -1,16 +1,70 @@
 
 import catkit
+import functools
 import numpy as np
 import warnings
 
-from ase import neighborlist
-from ase.neighborlist import natural_cutoffs
-from pymatgen.io.ase import AseAtomsAdaptor
-from pymatgen.analysis.local_env import VoronoiNN
-from .constants import COVALENT_RADIUS
+from ase import Atoms
+from ase.geometry import get_distances
+from ase.neighborlist import natural_cutoffs, neighbor_list
+from joblib import Parallel, delayed
+from scipy.sparse import csr_matrix, triu
+from .constants import COVALENT_RADIUS_LUT
 from .surfaces import constrain_surface
 
 
+@functools.lru_cache(maxsize=128)
+def _get_connectivity(numbers, positions, cell, pbc):
+    """
+    Generate the connectivity matrix of an adsorbate from its atomic numbers
+    and the raw bytes of its positions and cell (see `Combined.get_connectivity`).
+    """
+    adsorbate = Atoms(numbers=numbers,
+                      positions=np.frombuffer(positions).reshape(-1, 3),
+                      cell=np.frombuffer(cell).reshape(3, 3),
+                      pbc=pbc)
+
+    # `neighbor_list` is the vectorized counterpart of `NeighborList`. The
+    # latter pads every cutoff with a 0.3 angstrom skin by default, so we
+    # add it here too to keep the same bonds.
+    cutoff = [radius + 0.3 for radius in natural_cutoffs(adsorbate)]
+    i, j = neighbor_list('ij', adsorbate, cutoff)
+    n_atoms = len(adsorbate)
+    matrix = csr_matrix((np.ones_like(i), (i, j)), shape=(n_atoms, n_atoms))
+    # Pairs found through more than one periodic image are summed, so reset them
+    matrix.data[:] = 1
+    return matrix
+
+
+def find_sites(surface, adsorbed_surface, bond_indices):
+    """
+    Finds the Cartesian coordinates of the bonding atoms of the adsorbate.
+
+    Args:
+        surface             `ase.Atoms` of the chosen surface
+        adsorbed_surface    An `ase graphic Atoms` object containing the
+                            adsorbate and surface.
+        bond_indices        A list of integers indicating the indices of the
+                            binding atoms of the adsorbate
+    Returns:
+        sites   A tuple of 3-tuples containing the Cartesian coordinates of
+                each of the binding atoms
+    """
+    binding_atom_indices = np.asarray(bond_indices, dtype=int) + len(surface)
+    positions = np.round(adsorbed_surface.positions[binding_atom_indices], 2)
+    sites = tuple(map(tuple, positions.tolist()))
+    return sites
+
+
+def _build_combined(adsorbate, surface, enumerate_all_configs, seed):
+    """
+    Worker for `Combined.build_many`. Each worker process has its own copy of
+    `np.random`, so it is seeded explicitly to keep random placements reproducible.
+    """
+    np.random.seed(seed)
+    return Combined(adsorbate, surface, enumerate_all_configs)
+
+
 class Combined():
     '''
     This class handles all things with the adsorbate placed on a surface
@@ -52,6 +106,8 @@ class Combined():
         self.adsorbate = adsorbate
         self.surface = surface
         self.enumerate_all_configs = enumerate_all_configs
+        # The slab is the first part of every placement, so its radii are looked up once
+        self.slab_covalent_radii = COVALENT_RADIUS_LUT[self.surface.surface_atoms.numbers]
 
         self.add_adsorbate_onto_surface(self.adsorbate.atoms, self.surface.surface_atoms, self.adsorbate.bond_indices)
 
@@ -62,9 +118,30 @@ class Combined():
             self.constrained_adsorbed_surfaces.append(constrain_surface(atoms))
 
             # Do the hashing
-            self.all_sites.append(self.find_sites(self.surface.constrained_surface, self.constrained_adsorbed_surfaces[-1], self.adsorbate.bond_indices))
+            self.all_sites.append(find_sites(self.surface.constrained_surface, self.constrained_adsorbed_surfaces[-1], self.adsorbate.bond_indices))
 
 
+    @classmethod
+    def build_many(cls, pairs, enumerate_all_configs, n_jobs=1):
+        '''
+        Builds one `Combined` object per (adsorbate, surface) pair. The pairs are
+        independent, so they can be spread over worker processes. Note that the
+        workers do not share the connectivity cache, and that every `Combined`
+        object is kept in memory until all of them are done.
+
+        Args:
+            pairs: a list of (`Adsorbate`, `Surface`) tuples
+            enumerate_all_configs: whether to enumerate all adslab placements instead of choosing one random
+            n_jobs: number of processes to use (see `joblib.Parallel`). -1 uses all CPUs; 1 runs serially.
+        Returns:
+            a list of `Combined` objects, in the same order as `pairs`
+        '''
+        # Draw the worker seeds here so the results only depend on the caller's seed
+        seeds = np.random.randint(2**31 - 1, size=len(pairs))
+        return Parallel(n_jobs=n_jobs, backend='loky')(
+            delayed(_build_combined)(adsorbate, surface, enumerate_all_configs, seed)
+            for (adsorbate, surface), seed in zip(pairs, seeds))
+
     def add_adsorbate_onto_surface(self, adsorbate, surface, bond_indices):
         '''
         There are a lot of small details that need to be considered when adding an
@@ -82,12 +159,15 @@ class Combined():
                                     surface atoms will be tagged with `1`, and the the
                                     adsorbate atoms will be tagged with `2` or above.
             adsorbed_surface_sampling_strs: String specifying the sample, [index]/[total]
-                                            of reasonable adsorbed surfaces
+                                            of reasonable adsorbed surfaces when enumerating
+                                            all configs. When picking one random config, the
+                                            index and total are out of all the generated
+                                            placements, since we stop checking placements
+                                            once a reasonable one is found.
         '''
         # convert surface atoms into graphic atoms object
         surface_gratoms = catkit.Gratoms(surface)
-        surface_atom_indices = [i for i, atom in enumerate(surface)
-                                if atom.tag == 1]
+        surface_atom_indices = np.flatnonzero(surface.get_tags() == 1).tolist()
         surface_gratoms.set_surface_atoms(surface_atom_indices)
         surface_gratoms.pbc = np.array([True, True, False])
 
@@ -105,23 +185,35 @@ class Combined():
                                                       bonds=bond_indices,
                                                       index=-1)
 
-        # Filter out unreasonable structures.
-        # Then pick one from the reasonable configurations list as an output.
-        reasonable_adsorbed_surfaces = [surface for surface in adsorbed_surfaces
-                                        if self.is_config_reasonable(surface)]
-
         self.adsorbed_surface_atoms = []
         self.adsorbed_surface_sampling_strs = []
         if self.enumerate_all_configs:
+            # Filter out unreasonable structures and keep all the others. Most of the
+            # rejected placements fall outside the unit cell, so that cheap test is
+            # run over all of them first and only the survivors are checked for burial.
+            in_cell_adsorbed_surfaces = [surface for surface in adsorbed_surfaces
+                                         if self._is_within_unit_cell(surface)]
+            reasonable_adsorbed_surfaces = [surface for surface in in_cell_adsorbed_surfaces
+                                            if self._is_not_buried(surface)]
+            for surface in reasonable_adsorbed_surfaces:
+                self._merge_binding_atom_tags(surface)
             self.num_configs = len(reasonable_adsorbed_surfaces)
             for ind, reasonable_config in enumerate(reasonable_adsorbed_surfaces):
                 self.adsorbed_surface_atoms.append(reasonable_config)
                 self.adsorbed_surface_sampling_strs.append(str(ind) + '/' + str(len(reasonable_adsorbed_surfaces)))
         else:
+            # Go through the configurations in a random order and keep the first
+            # reasonable one. This picks uniformly among the reasonable ones without
+            # having to check all of them.
             self.num_configs = 1
-            reasonable_adsorbed_surface_index = np.random.choice(len(reasonable_adsorbed_surfaces))
-            self.adsorbed_surface_atoms.append(reasonable_adsorbed_surfaces[reasonable_adsorbed_surface_index])
-            self.adsorbed_surface_sampling_strs.append(str(reasonable_adsorbed_surface_index) + '/' + str(len(reasonable_adsorbed_surfaces)))
+            for adsorbed_surface_index in np.random.permutation(len(adsorbed_surfaces)):
+                if self.is_config_reasonable(adsorbed_surfaces[adsorbed_surface_index]):
+                    break
+            else:
+                raise ValueError('None of the %i adsorbate placements is reasonable'
+                                 % len(adsorbed_surfaces))
+            self.adsorbed_surface_atoms.append(adsorbed_surfaces[adsorbed_surface_index])
+            self.adsorbed_surface_sampling_strs.append(str(adsorbed_surface_index) + '/' + str(len(adsorbed_surfaces)))
 
     def convert_adsorbate_atoms_to_gratoms(self, adsorbate, bond_indices):
         """
@@ -139,7 +231,12 @@ class Combined():
             adsorbate_gratoms   An graphic atoms object of the adsorbate.
         """
         connectivity = self.get_connectivity(adsorbate)
-        adsorbate_gratoms = catkit.Gratoms(adsorbate, edges=connectivity)
+        # pass the bonds as an edge list rather than a dense adjacency matrix;
+        # keep only the upper triangle so each bond is added once (a periodic
+        # adsorbate gets a MultiGraph, which would otherwise double every edge)
+        bonds = triu(connectivity, k=1).tocoo()
+        edges = list(zip(bonds.row.tolist(), bonds.col.tolist()))
+        adsorbate_gratoms = catkit.Gratoms(adsorbate, edges=edges)
         # tag adsorbate atoms: non-binding atoms as 2, the binding atom(s) as 3 for now to
         # track adsorption site for analyzing if adslab configuration is reasonable.
         adsorbate_gratoms.set_tags([3 if idx in bond_indices else 2 for idx in range(len(adsorbate_gratoms))])
@@ -147,19 +244,20 @@ class Combined():
 
     def get_connectivity(self, adsorbate):
         """
-        Generate the connectivity of an adsorbate atoms obj.
+        Generate the connectivity of an adsorbate atoms obj. The same adsorbate
+        is placed on many surfaces, so the result is memoized on the adsorbate's
+        atomic numbers, positions, cell and pbc.
 
         Args:
             adsorbate  An `ase.Atoms` object of the adsorbate
 
         Returns:
-            matrix     The connectivity matrix of the adsorbate.
+            matrix     The connectivity matrix of the adsorbate as a
+                       `scipy.sparse.csr_matrix`. It is shared between calls,
+                       so do not modify it in place.
         """
-        cutoff = natural_cutoffs(adsorbate)
-        neighborList = neighborlist.NeighborList(cutoff, self_interaction=False, bothways=True)
-        neighborList.update(adsorbate)
-        matrix = neighborlist.get_connectivity_matrix(neighborList.nl).toarray()
-        return matrix
+        return _get_connectivity(tuple(adsorbate.numbers.tolist()), adsorbate.positions.tobytes(),
+                                 adsorbate.cell.array.tobytes(), tuple(adsorbate.pbc))
 
     def is_config_reasonable(self, adslab):
         """
@@ -177,66 +275,59 @@ class Combined():
             A boolean indicating whether or not the adsorbate placement is
             reasonable.
         """
-        vnn = VoronoiNN(allow_pathological=True, tol=0.2, cutoff=10)
-        adsorbate_indices = [atom.index for atom in adslab if atom.tag >= 2]
-        adsorbate_bond_indices = [atom.index for atom in adslab if atom.tag == 3]
-        structure = AseAtomsAdaptor.get_structure(adslab)
-        slab_lattice = structure.lattice
-
-        # Check to see if the fractional coordinates of the adsorption site is bounded
-        # by the slab unit cell. We loosen the threshold to -0.01 and 1.01
-        # to not wrongly exclude reasonable edge adsorption site.
-        for idx in adsorbate_bond_indices:
-            coord = slab_lattice.get_fractional_coords(structure[idx].coords)
-            if np.any((coord < -0.01) | (coord > 1.01)):
-                return False
-
-        # Then, check the covalent radius between each adsorbate atoms
-        # and its nearest neighbors that are slab atoms
-        # to make sure adsorbate is not buried into the surface
-        for idx in adsorbate_indices:
-            try:
-                nearneighbors = vnn.get_nn_info(structure, n=idx)
-            except ValueError:
-                return False
-
-            slab_nn = [nn for nn in nearneighbors if nn['site_index'] not in adsorbate_indices]
-            for nn in slab_nn:
-                ads_elem = structure[idx].species_string
-                nn_elem = structure[nn['site_index']].species_string
-                cov_bond_thres = 0.8 * (COVALENT_RADIUS[ads_elem] + COVALENT_RADIUS[nn_elem])/100
-                actual_dist = adslab.get_distance(idx, nn['site_index'], mic=True)
-                if actual_dist < cov_bond_thres:
-                    return False
-
-        # If the structure is reasonable, change tags of adsorbate atoms from 2 and 3 to 2 only
-        # for ML model compatibility and data cleanliness of the output adslab configurations
-        old_tags = adslab.get_tags()
-        adslab.set_tags(np.where(old_tags == 3, 2, old_tags))
+        # The unit cell check is cheap, so we do it before looking for buried atoms.
+        if not (self._is_within_unit_cell(adslab) and self._is_not_buried(adslab)):
+            return False
+        self._merge_binding_atom_tags(adslab)
         return True
 
-    def find_sites(self, surface, adsorbed_surface, bond_indices):
-        '''
-        Finds the Cartesian coordinates of the bonding atoms of the adsorbate.
+    def _is_within_unit_cell(self, adslab):
+        """
+        Check to see if the fractional coordinates of the adsorption site is bounded
+        by the slab unit cell. We loosen the threshold to -0.01 and 1.01
+        to not wrongly exclude reasonable edge adsorption site.
 
         Args:
-            surface             `ase.Atoms` of the chosen surface
-            adsorbed_surface    An `ase graphic Atoms` object containing the
-                                adsorbate and surface.
-            bond_indices        A list of integers indicating the indices of the
-                                binding atoms of the adsorbate
+            adslab          An `ase.Atoms` object of the adsorbate+slab complex.
+
         Returns:
-            sites   A tuple of 3-tuples containing the Cartesian coordinates of
-                    each of the binding atoms
-        '''
-        sites = []
-        for idx in bond_indices:
-            binding_atom_index = len(surface) + idx
-            atom = adsorbed_surface[binding_atom_index]
-            positions = tuple(round(coord, 2) for coord in atom.position)
-            sites.append(positions)
-
-        return tuple(sites)
+            A boolean indicating whether the binding atoms (tagged 3) are in the cell.
+        """
+        tags = adslab.get_tags()
+        bond_frac_coords = adslab.get_scaled_positions(wrap=False)[tags == 3]
+        return not np.any((bond_frac_coords < -0.01) | (bond_frac_coords > 1.01))
+
+    def _is_not_buried(self, adslab):
+        """
+        Check the covalent radius between each adsorbate atoms and the slab atoms
+        around it to make sure adsorbate is not buried into the surface. Only the
+        adsorbate-slab distances are computed; the slab atoms come first in
+        `adslab`, followed by the adsorbate.
+
+        Args:
+            adslab          An `ase.Atoms` object of the adsorbate+slab complex.
+
+        Returns:
+            A boolean indicating whether no adsorbate atom is too close to the slab.
+        """
+        n_slab = len(self.slab_covalent_radii)
+        adsorbate_covalent_radii = COVALENT_RADIUS_LUT[adslab.numbers[n_slab:]]
+        _, distances = get_distances(adslab.positions[n_slab:], adslab.positions[:n_slab],
+                                     cell=adslab.cell, pbc=adslab.pbc)
+        cov_bond_thres = 0.8 * (adsorbate_covalent_radii[:, None] + self.slab_covalent_radii[None, :])
+        return not np.any(distances < cov_bond_thres)
+
+    def _merge_binding_atom_tags(self, adslab):
+        """
+        Change tags of adsorbate atoms from 2 and 3 to 2 only for ML model
+        compatibility and data cleanliness of the output adslab configurations.
+        Only call this once the placement is known to be reasonable.
+
+        Args:
+            adslab          An `ase.Atoms` object of the adsorbate+slab complex.
+        """
+        tags = adslab.get_tags()
+        adslab.set_tags(np.where(tags == 3, 2, tags))
 
     def get_adsorbed_bulk_dict(self, ind):
         '''
@@ -1,5 +1,6 @@
+import numpy as np
 
-# unused?
+# Atomic number to element symbol
 ELEMENTS = {1: 'H', 2: 'He', 3: 'Li', 4: 'Be', 5: 'B', 6: 'C', 7: 'N', 8: 'O',
             9: 'F', 10: 'Ne', 11: 'Na', 12: 'Mg', 13: 'Al', 14: 'Si', 15: 'P',
             16: 'S', 17: 'Cl', 18: 'Ar', 19: 'K', 20: 'Ca', 21: 'Sc', 22: 'Ti',
@@ -43,6 +44,9 @@ COVALENT_RADIUS = {'H': 32.0, 'He': 46.0, 'O': 63.0, 'F': 64.0, 'Ne': 67.0, 'N':
                    'La': 180.0, 'Sr': 185.0, 'Ac': 186.0, 'K': 196.0, 'Ba': 196.0, 'Ra': 201.0,
                    'Rb': 210.0, 'Fr': 223.0, 'Cs': 232.0}
 
+# Covalent radius indexed by atomic number (unit is angstrom), for vectorized lookups
+COVALENT_RADIUS_LUT = np.array([0.] + [COVALENT_RADIUS[ELEMENTS[z]] / 100 for z in range(1, len(ELEMENTS) + 1)])
+
 # We will enumerate surfaces with Miller indices <= MAX_MILLER
 MAX_MILLER = 2
 
@@ -0,0 +1,161 @@
+'''
+Helpers for loading the pickled databases used when sampling structures.
+Pickles whose path ends with `.zst` are (de)compressed with zstandard. Large
+inverted indices (e.g. of bulks) can also be stored as a memory-mapped blob
+of individually pickled entries, so that only the sampled entries are ever
+unpickled and parallel workers share the file through the OS page cache.
+'''
+
+import functools
+import mmap
+import os
+import pickle
+from collections.abc import Sequence
+import numpy as np
+import zstandard as zstd
+
+
+ZSTD_SUFFIX = '.zst'
+MMAP_OFFSETS_SUFFIX = '.offsets.npy'
+MMAP_KEYS_SUFFIX = '.keys.npy'
+
+
+@functools.lru_cache(maxsize=4)
+def load_pickle(path):
+    '''
+    Loads a pickle file, decompressing it first if it is zstd compressed. The
+    result is memoized by path so that sampling many structures in the same
+    process only reads and deserializes each database once.
+
+    Note that the same object is returned on every call with the same path,
+    so callers must not modify it in place.
+
+    Args:
+        path    A string pointing to the pickle file
+    Returns:
+        The unpickled object
+    '''
+    with open(path, 'rb', buffering=1 << 20) as f:
+        if path.endswith(ZSTD_SUFFIX):
+            return pickle.loads(zstd.ZstdDecompressor().decompressobj().decompress(f.read()))
+        return pickle.load(f)
+
+
+def dump_pickle(obj, path, level=3):
+    '''
+    Pickles an object to a file, compressing it with zstd if the path ends
+    with `.zst`. The file is written under a temporary name and then renamed,
+    so concurrent readers never see a partially written file.
+
+    Args:
+        obj     The object to pickle
+        path    A string pointing to the output file
+        level   zstd compression level
+    '''
+    data = pickle.dumps(obj)
+    if path.endswith(ZSTD_SUFFIX):
+        data = zstd.ZstdCompressor(level=level).compress(data)
+    tmp_path = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class MmapPickleList(Sequence):
+    '''
+    Read-only list whose entries are pickled back to back in a memory-mapped
+    buffer. Entries are unpickled on access, so each access returns a new object.
+    '''
+
+    def __init__(self, buffer, offsets):
+        '''
+        Args:
+            buffer      `mmap.mmap` (or bytes) holding the pickled entries
+            offsets     An (n_entries, 2) array of the start and end byte of each entry
+        '''
+        self._buffer = buffer
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, end = self._offsets[index]
+        return pickle.loads(self._buffer[int(start):int(end)])
+
+
+def dump_mmap_index(inv_index, path):
+    '''
+    Writes an inverted index for `load_mmap_index`. Each entry is pickled
+    individually and appended to the file at `path`, and an (n_entries, 3) array
+    of `(key, start, end)` offsets is saved to `path + MMAP_OFFSETS_SUFFIX`. The
+    keys are also saved to `path + MMAP_KEYS_SUFFIX`, so that keys without any
+    entries are kept.
+
+    Args:
+        inv_index   Either a dict with integer keys whose values are lists of
+                    entries (e.g. bulks keyed by number of elements), or a flat
+                    list of entries, which is stored with a key of -1.
+        path        A string pointing to the output blob
+    '''
+    if isinstance(inv_index, dict):
+        buckets = sorted(inv_index.items())
+        assert all(key >= 0 for key, _ in buckets), 'Keys of the inverted index must be non-negative integers'
+    else:
+        buckets = [(-1, inv_index)]
+
+    offsets = []
+    with open(path, 'wb') as f:
+        for key, entries in buckets:
+            for entry in entries:
+                start = f.tell()
+                pickle.dump(entry, f)
+                offsets.append((key, start, f.tell()))
+    np.save(path + MMAP_OFFSETS_SUFFIX, np.array(offsets, dtype=np.int64).reshape(-1, 3))
+    np.save(path + MMAP_KEYS_SUFFIX, np.array([key for key, _ in buckets], dtype=np.int64))
+
+
+def load_mmap_index(path):
+    '''
+    Memory-maps an inverted index written by `dump_mmap_index`.
+
+    Args:
+        path    A string pointing to the blob of pickled entries
+    Returns:
+        A dict of `MmapPickleList`s with the same keys as the original
+        inverted index, or a single `MmapPickleList` if it was a flat list.
+    '''
+    with open(path, 'rb') as f:
+        # Empty files cannot be memory-mapped, but then there is nothing to read
+        if os.fstat(f.fileno()).st_size > 0:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = b''
+    offsets = np.load(path + MMAP_OFFSETS_SUFFIX)
+
+    entry_keys = offsets[:, 0]
+    if os.path.exists(path + MMAP_KEYS_SUFFIX):
+        keys = np.load(path + MMAP_KEYS_SUFFIX)
+    else:
+        keys = np.unique(entry_keys)
+    if np.all(keys == -1):
+        return MmapPickleList(buffer, offsets[:, 1:])
+    return {int(key): MmapPickleList(buffer, offsets[entry_keys == key, 1:])
+            for key in keys}
+
+
+def load_bulk_database(path):
+    '''
+    Loads a bulk database, memory-mapping it if it was written with
+    `dump_mmap_index` and unpickling it otherwise.
+
+    Args:
+        path    A string pointing to the bulk database
+    Returns:
+        The bulk inverted index (dict of lists or flat list of bulks)
+    '''
+    if os.path.exists(path + MMAP_OFFSETS_SUFFIX):
+        return load_mmap_index(path)
+    return load_pickle(path)
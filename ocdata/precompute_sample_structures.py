@@ -9,23 +9,14 @@ Note that some of these scripts were taken from
 __authors__ = ['Kevin Tran', 'Aini Palizhati', 'Siddharth Goyal', 'Zachary Ulissi']
 __email__ = ['ktran@andrew.cmu.edu']
 
-import math
-from collections import defaultdict
-import random
 import pickle
 import numpy as np
-import catkit
-import ase
-import ase.db
-from ase import neighborlist
-from ase.constraints import FixAtoms
-from ase.neighborlist import natural_cutoffs
 from pymatgen.io.ase import AseAtomsAdaptor
 from pymatgen.core.surface import SlabGenerator, get_symmetrically_distinct_miller_indices
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
-from pymatgen.analysis.local_env import VoronoiNN
 from .base_atoms.pkls import BULK_PKL, ADSORBATE_PKL
 from .constants import MAX_MILLER
+from .symmetry import get_spacegroup_analyzer
 import sys
 import time
 
@@ -92,7 +83,7 @@ def standardize_bulk(atoms):
         standardized_struct     `pymatgen.Structure` of the standardized bulk
     '''
     struct = AseAtomsAdaptor.get_structure(atoms)
-    sga = SpacegroupAnalyzer(struct, symprec=0.1)
+    sga = get_spacegroup_analyzer(struct, symprec=0.1)
     standardized_struct = sga.get_conventional_standard_structure()
     return standardized_struct
 
@@ -119,10 +110,8 @@ def is_structure_invertible(structure):
     # If any of the operations involve a transformation in the z-direction,
     # then the structure is invertible.
     sga = SpacegroupAnalyzer(structure, symprec=0.1)
-    for operation in sga.get_symmetry_operations():
-        xform_matrix = operation.affine_matrix
-        z_xform = xform_matrix[2, 2]
-        if z_xform == -1:
+    for operation in sga.get_symmetry_operations(cartesian=False):
+        if operation.rotation_matrix[2, 2] == -1:
             return True
     return False
 
@@ -1,17 +1,14 @@
 
-import math
 import numpy as np
-import os
-import pickle
 
-from ase import neighborlist
 from ase.constraints import FixAtoms
 from collections import defaultdict
 from pymatgen import Composition
+from pymatgen.core.periodic_table import Element
 from pymatgen.io.ase import AseAtomsAdaptor
-from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from pymatgen.analysis.local_env import VoronoiNN
 from .constants import MIN_XY
+from .symmetry import get_spacegroup_analyzer
 
 
 def constrain_surface(atoms):
@@ -35,10 +32,10 @@ def constrain_surface(atoms):
     # Work on a copy so that we don't modify the original
     atoms = atoms.copy()
 
-    # We'll be making a `mask` list to feed to the `FixAtoms` class. This list
+    # We'll be making a `mask` array to feed to the `FixAtoms` class. This array
     # should contain a `True` if we want an atom to be constrained, and `False`
     # otherwise
-    mask = [True if atom.tag == 0 else False for atom in atoms]
+    mask = atoms.get_tags() == 0
     atoms.constraints += [FixAtoms(mask=mask)]
     return atoms
 
@@ -85,16 +82,28 @@ class Surface():
         surface_struct, self.millers, self.shift, self.top = surface_info
         self.surface_sampling_str = str(surface_index) + "/" + str(total_surfaces_possible)
 
+        self.surface_atoms = self.tile_and_tag_surface(surface_struct)
+        self.constrained_surface = constrain_surface(self.surface_atoms)
+
+    def tile_and_tag_surface(self, surface_struct):
+        '''
+        Tiles the unit surface and tags its surface atoms.
+
+        Args:
+            surface_struct  `pymatgen.Structure` of the unit surface
+        Returns:
+            surface_atoms   The tiled and tagged surface as `ase.Atoms`
+        '''
         unit_surface_atoms = AseAtomsAdaptor.get_atoms(surface_struct)
-        self.surface_atoms = self.tile_atoms(unit_surface_atoms)
+        surface_atoms = self.tile_atoms(unit_surface_atoms)
 
         # verify that the bulk and surface elements and stoichiometry match:
-        assert (Composition(self.surface_atoms.get_chemical_formula()).reduced_formula ==
-            Composition(bulk_object.bulk_atoms.get_chemical_formula()).reduced_formula), \
+        assert (Composition(surface_atoms.get_chemical_formula()).reduced_formula ==
+            Composition(self.bulk_object.bulk_atoms.get_chemical_formula()).reduced_formula), \
             'Mismatched bulk and surface'
 
-        self.tag_surface_atoms(self.bulk_object.bulk_atoms, self.surface_atoms)
-        self.constrained_surface = constrain_surface(self.surface_atoms)
+        self.tag_surface_atoms(self.bulk_object.bulk_atoms, surface_atoms)
+        return surface_atoms
 
     def tile_atoms(self, atoms):
         '''
@@ -109,8 +118,8 @@ class Surface():
         '''
         x_length = np.linalg.norm(atoms.cell[0])
         y_length = np.linalg.norm(atoms.cell[1])
-        nx = int(math.ceil(MIN_XY/x_length))
-        ny = int(math.ceil(MIN_XY/y_length))
+        nx = int(np.ceil(MIN_XY/x_length))
+        ny = int(np.ceil(MIN_XY/y_length))
         n_xyz = (nx, ny, 1)
         atoms_tiled = atoms.repeat(n_xyz)
         return atoms_tiled
@@ -131,8 +140,8 @@ class Surface():
         voronoi_tags = self._find_surface_atoms_with_voronoi(bulk_atoms, surface_atoms)
         height_tags = self._find_surface_atoms_by_height(surface_atoms)
         # If either of the methods consider an atom a "surface atom", then tag it as such.
-        tags = [max(v_tag, h_tag) for v_tag, h_tag in zip(voronoi_tags, height_tags)]
-        surface_atoms.set_tags(tags)
+        tags = np.maximum(voronoi_tags, height_tags)
+        surface_atoms.set_tags(tags.tolist())
 
     def _find_surface_atoms_with_voronoi(self, bulk_atoms, surface_atoms):
         '''
@@ -153,7 +162,7 @@ class Surface():
                             from.
             surface_atoms   `ase.Atoms` of the surface
         Returns:
-            tags    A list of 0's and 1's whose indices align with the atoms in
+            tags    A `np.ndarray` of 0's and 1's whose indices align with the atoms in
                     `surface_atoms`. 0's indicate a bulk atom and 1 indicates a
                     surface atom.
         '''
@@ -185,14 +194,18 @@ class Surface():
             # Tag as bulk otherwise
             else:
                 tags.append(0)
-        return tags
+        return np.array(tags, dtype=np.int8)
 
 
     def calculate_center_of_mass(self, struct):
         '''
         Determine the surface atoms indices from here
         '''
-        weights = [site.species.weight for site in struct]
+        # Look up the mass of each distinct element once and gather it per site
+        species_strings = np.array([site.species_string for site in struct])
+        unique_species, species_indices = np.unique(species_strings, return_inverse=True)
+        unique_weights = np.array([float(Element(species).atomic_mass) for species in unique_species])
+        weights = unique_weights[species_indices]
         center_of_mass = np.average(struct.frac_coords,
                                     weights=weights, axis=0)
         return center_of_mass
@@ -216,14 +229,25 @@ class Surface():
 
         # Object type conversion so we can use Voronoi
         bulk_struct = AseAtomsAdaptor.get_structure(bulk_atoms)
-        sga = SpacegroupAnalyzer(bulk_struct)
+        sga = get_spacegroup_analyzer(bulk_struct)
         sym_struct = sga.get_symmetrized_structure()
 
+        # Tessellate the whole bulk once. This uses a fixed cutoff, so bulks with
+        # large gaps between atoms can fail; the per-site calculation retries with
+        # larger cutoffs, so fall back to it in that case.
+        try:
+            all_nn_info = voronoi_nn.get_all_nn_info(sym_struct)
+        except RuntimeError:
+            all_nn_info = None
+
         # We'll only loop over the symmetrically distinct sites for speed's sake
         bulk_cn_dict = defaultdict(set)
         for idx in sym_struct.equivalent_indices:
             site = sym_struct[idx[0]]
-            cn = voronoi_nn.get_cn(sym_struct, idx[0], use_weights=True)
+            if all_nn_info is not None:
+                cn = sum(nn['weight'] for nn in all_nn_info[idx[0]])
+            else:
+                cn = voronoi_nn.get_cn(sym_struct, idx[0], use_weights=True)
             cn = round(cn, 5)
             bulk_cn_dict[site.species_string].add(cn)
         return bulk_cn_dict
@@ -244,16 +268,14 @@ class Surface():
             surface_atoms   The surface where you are trying to find surface sites in
                             `ase.Atoms` format
         Returns:
-            tags            A list that contains the indices of
-                            the surface atoms
+            tags            A `np.ndarray` of 0's and 1's where 1 indicates
+                            a surface atom
         '''
         unit_cell_height = np.linalg.norm(surface_atoms.cell[2])
-        scaled_positions = surface_atoms.get_scaled_positions()
-        scaled_max_height = max(scaled_position[2] for scaled_position in scaled_positions)
-        scaled_threshold = scaled_max_height - 2. / unit_cell_height
+        scaled_heights = surface_atoms.get_scaled_positions()[:, 2]
+        scaled_threshold = scaled_heights.max() - 2. / unit_cell_height
 
-        tags = [0 if scaled_position[2] < scaled_threshold else 1
-                for scaled_position in scaled_positions]
+        tags = (scaled_heights >= scaled_threshold).astype(np.int8)
         return tags
 
     def get_bulk_dict(self):
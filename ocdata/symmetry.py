@@ -0,0 +1,39 @@
+'''
+Memoized spacegroup analysis. `SpacegroupAnalyzer` calls spglib, which is
+expensive, and the same bulk gets analyzed several times per sample (e.g. when
+standardizing it and when finding the coordination of its atoms for each
+surface), so we share the analyzers across calls. Only use this for bulks;
+slabs are all distinct and would just evict the bulks from the cache.
+'''
+
+import functools
+from pymatgen import Structure
+from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+
+def get_spacegroup_analyzer(struct, symprec=0.01):
+    '''
+    Returns a `SpacegroupAnalyzer` for a structure, reusing a previously
+    created one if the same structure was already analyzed with the same
+    tolerance.
+
+    Args:
+        struct      `pymatgen.Structure` to analyze
+        symprec     Tolerance for symmetry finding (pymatgen's default is 0.01)
+    Returns:
+        sga         `pymatgen.symmetry.analyzer.SpacegroupAnalyzer` of `struct`
+    '''
+    struct_key = (tuple(map(tuple, struct.lattice.matrix.round(8))),
+                  tuple((site.species_string, *site.frac_coords.round(8)) for site in struct))
+    return _get_sga(struct_key, symprec)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_sga(struct_key, symprec):
+    '''
+    Builds the `SpacegroupAnalyzer` of the structure described by `struct_key`
+    (see `get_spacegroup_analyzer`).
+    '''
+    lattice, sites = struct_key
+    struct = Structure(lattice, [site[0] for site in sites], [site[1:] for site in sites])
+    return SpacegroupAnalyzer(struct, symprec=symprec)
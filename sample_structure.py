@@ -4,6 +4,7 @@ from ocdata.adsorbates import Adsorbate
 from ocdata.bulk_obj import Bulk
 from ocdata.surfaces import Surface
 from ocdata.combined import Combined
+from ocdata.loaders import load_bulk_database
 
 import argparse
 import logging
@@ -85,14 +86,17 @@ class StructureSampler():
         and stores them in self.all_bulks
         '''
         self.all_bulks = []
-        with open(self.args.bulk_db, 'rb') as f:
-            bulk_db_lookup = pickle.load(f)
+        bulk_db_lookup = load_bulk_database(self.args.bulk_db)
 
         if self.args.enumerate_all_structures:
             for ind in self.bulk_indices_list:
-                self.all_bulks.append(Bulk(bulk_db_lookup, self.args.precomputed_structures, ind))
+                self.all_bulks.append(Bulk(bulk_db_lookup, self.args.precomputed_structures, ind,
+                                          surface_cache_dir=self.args.surface_cache_dir,
+                                          n_jobs=self.args.n_jobs))
         else:
-            self.all_bulks.append(Bulk(bulk_db_lookup, self.args.precomputed_structures))
+            self.all_bulks.append(Bulk(bulk_db_lookup, self.args.precomputed_structures,
+                                      surface_cache_dir=self.args.surface_cache_dir,
+                                      n_jobs=self.args.n_jobs))
 
     def _load_and_write_surfaces(self):
         '''
@@ -110,18 +114,27 @@ class StructureSampler():
                     self.logger.info(f'Enumerating all {len(possible_surfaces)} surfaces for bulk {self.bulk_indices_list[bulk_ind]}')
                     included_surface_indices = range(len(possible_surfaces))
 
-                for cur_surface_ind in included_surface_indices:
-                    surface_info = possible_surfaces[cur_surface_ind]
-                    surface = Surface(bulk, surface_info, cur_surface_ind, len(possible_surfaces))
-                    self._combine_and_write(surface, self.bulk_indices_list[bulk_ind], cur_surface_ind)
+                if self.args.n_jobs == 1:
+                    for cur_surface_ind in included_surface_indices:
+                        surface_info = possible_surfaces[cur_surface_ind]
+                        surface = Surface(bulk, surface_info, cur_surface_ind, len(possible_surfaces))
+                        self._combine_and_write(surface, self.bulk_indices_list[bulk_ind], cur_surface_ind)
+                else:
+                    surfaces = [Surface(bulk, possible_surfaces[cur_surface_ind], cur_surface_ind, len(possible_surfaces))
+                                for cur_surface_ind in included_surface_indices]
+                    # Placing the adsorbate is independent for each surface, so do it in parallel
+                    all_combined = Combined.build_many([(self.adsorbate, surface) for surface in surfaces],
+                                                       self.args.enumerate_all_structures, n_jobs=self.args.n_jobs)
+                    for cur_surface_ind, surface, combined in zip(included_surface_indices, surfaces, all_combined):
+                        self._combine_and_write(surface, self.bulk_indices_list[bulk_ind], cur_surface_ind, combined)
             else:
-                surface_info_index = np.random.choice(len(possible_surfaces))
+                surface_info_index = np.random.randint(len(possible_surfaces))
                 surface = Surface(bulk, possible_surfaces[surface_info_index], surface_info_index, len(possible_surfaces))
                 self.adsorbate = Adsorbate(self.args.adsorbate_db)
                 self._combine_and_write(surface)
 
 
-    def _combine_and_write(self, surface, cur_bulk_index=None, cur_surface_index=None):
+    def _combine_and_write(self, surface, cur_bulk_index=None, cur_surface_index=None, combined=None):
         '''
         Add the adsorbate onto a given surface in a Combined object.
         Writes output files for the surface itself and the combined surface+adsorbate
@@ -130,6 +143,7 @@ class StructureSampler():
             surface: a Surface object to combine with self.adsorbate
             cur_bulk_index: current bulk index from self.bulk_indices_list
             cur_surface_index: current surface index if enumerating all
+            combined: an already built Combined object for this surface, if any
         '''
         if self.args.enumerate_all_structures:
             output_name_template = f'{self.args.adsorbate_index}_{cur_bulk_index}_{cur_surface_index}'
@@ -138,7 +152,8 @@ class StructureSampler():
 
         self._write_surface(surface, output_name_template)
 
-        combined = Combined(self.adsorbate, surface, self.args.enumerate_all_structures)
+        if combined is None:
+            combined = Combined(self.adsorbate, surface, self.args.enumerate_all_structures)
         self._write_adsorbed_surface(combined, output_name_template)
 
     def _write_surface(self, surface, output_name_template):
@@ -200,6 +215,8 @@ def parse_args():
 
     # for optimized (automatically try to use optimized if this is provided)
     parser.add_argument('--precomputed_structures', type=str, default=None, help='Root directory of precomputed structures')
+    parser.add_argument('--surface_cache_dir', type=str, default=None,
+        help='Directory to cache enumerated surfaces in when not using precomputed structures')
 
     # args for enumerating all combinations:
     parser.add_argument('--enumerate_all_structures', action='store_true', default=False,
@@ -208,6 +225,9 @@ def parse_args():
     parser.add_argument('--bulk_indices', type=str, default=None, help='Comma separated list of bulk indices')
     parser.add_argument('--surface_index', type=int, default=None, help='Optional surface index (int)')
 
+    parser.add_argument('--n_jobs', type=int, default=1,
+        help='Number of processes to use for enumerating surfaces and, when enumerating all '
+             'structures, for placing the adsorbate on them (-1 uses all CPUs)')
     parser.add_argument('--verbose', action='store_true', default=False, help='Log detailed info')
 
     # check that all needed args are supplied
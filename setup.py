@@ -20,5 +20,5 @@ setup(name='ocdata',
                   ('ocdata/base_atoms/pkls', ['ocdata/base_atoms/pkls/bulks.pkl',
                                               'ocdata/base_atoms/pkls/adsorbates.pkl'])],
       include_package_data=True,
-      install_requires=['pymatgen==2020.4.2', 'ase>=3.19.1', 'catkit @ git+https://github.com/SUNCAT-Center/CatKit.git#egg=catkit'],
+      install_requires=['pymatgen==2020.4.2', 'ase>=3.19.1', 'zstandard', 'joblib', 'catkit @ git+https://github.com/SUNCAT-Center/CatKit.git#egg=catkit'],
       long_description='''Module for generating random catalyst adsorption configurations for high-throughput dataset generation.''',)